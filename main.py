@@ -10,6 +10,14 @@ from pathlib import Path
 import multiprocessing
 import webbrowser
 import urllib.request
+import hashlib
+import io
+import os
+import subprocess
+import copy
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 # 外部ライブラリのインポート
 try:
@@ -33,8 +41,65 @@ ICON_SIZE = (18, 18)
 
 RESOURCE_PATH = Path(getattr(sys, "_MEIPASS", ""))
 """実行ファイル内の一時パス、または開発中の相対パス"""
+FFMPEG_PATH = RESOURCE_PATH / "ffmpeg" / "ffmpeg.exe"
 SETTINGS_PATH = Path.home() / ".config" / APP_NAME / "settings.json"
 SETTINGS_PATH.parent.mkdir(parents=True, exist_ok=True)
+SETTINGS_SCHEMA_VERSION = 2
+SETTINGS_SAVE_DELAY_MS = 1000
+"""最後の変更から設定ファイルへ書き込むまでの待ち時間 (ミリ秒)"""
+DEFAULT_OPTIONS = {
+    "save_path": str(Path.home() / "Downloads"),
+    "filename_template": "%(title)s [%(id)s]",
+    "format": "mp4",
+    "quality": "1080p",
+}
+
+# --- プレビュー用サムネイルの設定 ---
+THUMBNAIL_SIZE = (240, 135)
+THUMBNAIL_CACHE_PATH = SETTINGS_PATH.parent / "thumbnails"
+THUMBNAIL_MEMORY_LIMIT = 32 * 1024 * 1024
+"""デコード済みサムネイルをメモリに保持する上限 (バイト)"""
+THUMBNAIL_DISK_LIMIT = 64 * 1024 * 1024
+"""縮小済みサムネイルをディスクに保持する上限 (バイト)"""
+THUMBNAIL_FETCH_WORKERS = 4
+PREVIEW_DEBOUNCE_MS = 150
+
+# --- ダウンロード後の検証の設定 ---
+VERIFY_WORKERS = 2
+VERIFY_CHUNK_SIZE = 1024 * 1024
+VERIFY_MAX_RETRIES = 2
+"""検証に失敗した項目を自動で再ダウンロードする最大回数"""
+VERIFY_SIZE_TOLERANCE = 0.95
+"""期待されるファイルサイズに対して許容する最小の割合"""
+VERIFY_MANIFEST_NAME = "VidDown.sha256"
+
+# --- 保存形式・画質とyt-dlpのオプションの対応 ---
+QUALITY_MAP = {
+    "最高画質": None,
+    "4320p (8K)": "res:4320",
+    "2160p (4K)": "res:2160",
+    "1440p (2K)": "res:1440",
+    "1080p": "res:1080",
+    "720p": "res:720",
+    "480p": "res:480",
+    "360p": "res:360",
+    "最小ファイルサイズ": "+size",
+}
+AUDIO_FORMAT_MAP = {
+    "最良音声": "ba/b",
+    "mp3": "ba[acodec^=mp3]/ba/b",
+    "m4a": "ba[acodec^=aac]/ba[acodec^=mp4a.40.]/ba/b",
+    "opus": "ba/b",
+    "wav": "ba/b",
+    "flac": "ba/b",
+}
+FORMAT_CHOICES = [
+    "最良動画", "mp4", "mp4+aac", "webm", "mkv",
+    "最良音声", "mp3", "m4a", "wav", "flac",  # "opus"
+]
+QUALITY_CHOICES = list(QUALITY_MAP)
+OPTION_CHOICES = {"format": FORMAT_CHOICES, "quality": QUALITY_CHOICES}
+"""選択肢が決まっているオプション -> コンボボックスに表示する値"""
 
 
 def load_fonts():
@@ -54,6 +119,596 @@ def load_fonts():
         else:
             print(f"警告: フォントファイルが見つかりません: {font_path}")
 
+
+def _migrate_settings_v1(settings):
+    """v1: テーマのみをトップレベルに保存していた形式"""
+    return {
+        "theme": settings.get("theme", "dark"),
+        "options": {},
+        "presets": {},
+    }
+
+
+SETTINGS_MIGRATIONS = {1: _migrate_settings_v1}
+"""バージョン -> 次のバージョンの形式へ変換する関数"""
+
+
+class SettingsStore:
+    """設定を起動時に一度だけ読み込み、メモリ上で保持する
+
+    変更は `root.after` で SETTINGS_SAVE_DELAY_MS ミリ秒まとめてから書き込み、
+    一時ファイルからの置き換えで書き込み途中に終了しても設定ファイルが壊れないようにする。
+    変更と書き込みはTkのスレッドから行い、ワーカースレッドからは読み取りのみ行うこと。
+    """
+
+    def __init__(self, root, path=SETTINGS_PATH, save_delay_ms=SETTINGS_SAVE_DELAY_MS):
+        self.root = root
+        self.path = Path(path)
+        self.save_delay_ms = save_delay_ms
+        self._lock = threading.Lock()
+        self._after_id = None
+        self._dirty = False
+        self._data = self._load()
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._data.get(key, default)
+
+    def set(self, key, value):
+        with self._lock:
+            if self._data.get(key) == value:
+                return
+            self._data[key] = value
+        self._schedule_save()
+
+    def get_option(self, key):
+        with self._lock:
+            return self._data["options"].get(key, DEFAULT_OPTIONS[key])
+
+    def set_option(self, key, value):
+        with self._lock:
+            if self._data["options"].get(key) == value:
+                return
+            self._data["options"][key] = value
+        self._schedule_save()
+
+    def options(self):
+        """すべてのオプションを既定値で補完した辞書のコピーを返す"""
+        with self._lock:
+            return {**DEFAULT_OPTIONS, **self._data["options"]}
+
+    def presets(self):
+        with self._lock:
+            return sorted(self._data["presets"])
+
+    def get_preset(self, name):
+        with self._lock:
+            preset = self._data["presets"].get(name)
+            return dict(preset) if preset is not None else None
+
+    def save_preset(self, name, options):
+        with self._lock:
+            self._data["presets"][name] = dict(options)
+        self._schedule_save()
+
+    def delete_preset(self, name):
+        with self._lock:
+            if self._data["presets"].pop(name, None) is None:
+                return
+        self._schedule_save()
+
+    def flush(self):
+        """保留中の変更があれば直ちに書き込む"""
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+        if not self._dirty:
+            return
+        self._dirty = False
+        with self._lock:
+            text = json.dumps(self._data, indent=4, ensure_ascii=False)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"設定の保存に失敗: {e}")
+
+    def _schedule_save(self):
+        self._dirty = True
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+        self._after_id = self.root.after(self.save_delay_ms, self._save_now)
+
+    def _save_now(self):
+        self._after_id = None
+        self.flush()
+
+    def _load(self):
+        if not self.path.exists():
+            return self._migrate({})
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            return self._migrate(data)
+        except (OSError, ValueError) as e:
+            # 壊れたファイルは次の保存で上書きされる前に退避しておく。
+            # 以前の退避ファイルを上書きしないよう、名前に日時を付ける
+            print(f"設定の読み込みに失敗: {e}")
+            backup_name = f"{self.path.name}.{time.strftime('%Y%m%d-%H%M%S')}.bak"
+            try:
+                os.replace(self.path, self.path.with_name(backup_name))
+            except OSError:
+                pass
+            return self._migrate({})
+
+    def _migrate(self, data):
+        """読み込んだ設定を検証し、最新の形式へ変換する。不正な場合はValueError"""
+        if not isinstance(data, dict):
+            raise ValueError("設定ファイルの形式が不正です")
+        version = data.get("version", 1) if data else SETTINGS_SCHEMA_VERSION
+        if (
+            not isinstance(version, int)
+            or isinstance(version, bool)
+            or not 1 <= version <= SETTINGS_SCHEMA_VERSION
+        ):
+            raise ValueError(f"未対応の設定バージョンです: {version!r}")
+        while version < SETTINGS_SCHEMA_VERSION:
+            data = SETTINGS_MIGRATIONS[version](data)
+            version += 1
+            self._dirty = True
+        data = {"version": version, **data}
+        data.setdefault("theme", "dark")
+        data.setdefault("options", {})
+        data.setdefault("presets", {})
+
+        if not isinstance(data["theme"], str):
+            raise ValueError("theme の形式が不正です")
+        if not self._is_options(data["options"]):
+            raise ValueError("options の形式が不正です")
+        presets = data["presets"]
+        if not isinstance(presets, dict) or not all(
+            self._is_options(preset) for preset in presets.values()
+        ):
+            raise ValueError("presets の形式が不正です")
+        data["options"] = self._sanitize_options(data["options"])
+        data["presets"] = {
+            name: self._sanitize_options(preset) for name, preset in presets.items()
+        }
+        return data
+
+    def _sanitize_options(self, options):
+        """選択肢に無い保存形式・画質を取り除き、既定値が使われるようにする"""
+        valid = {
+            key: value
+            for key, value in options.items()
+            if key not in OPTION_CHOICES or value in OPTION_CHOICES[key]
+        }
+        if len(valid) != len(options):
+            print(f"警告: 未対応のオプションを既定値に戻します: {options}")
+            self._dirty = True
+        return valid
+
+    @staticmethod
+    def _is_options(options):
+        return isinstance(options, dict) and all(
+            key in DEFAULT_OPTIONS and isinstance(value, str)
+            for key, value in options.items()
+        )
+
+
+def format_duration(seconds):
+    """秒数を "h:mm:ss" または "m:ss" 形式の文字列に変換する"""
+    if seconds is None:
+        return "不明"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
+def select_thumbnail_url(info, width=THUMBNAIL_SIZE[0]):
+    """info辞書から、プレビューの幅以上で最も小さいサムネイルのURLを選ぶ"""
+    thumbnails = [t for t in info.get("thumbnails") or [] if t.get("url")]
+    if not thumbnails:
+        return info.get("thumbnail")
+    sized = [t for t in thumbnails if (t.get("width") or 0) >= width]
+    if sized:
+        return min(sized, key=lambda t: t["width"])["url"]
+    # サイズ情報が無い場合、yt-dlpは品質の昇順に並べているので末尾を使う
+    return thumbnails[-1]["url"]
+
+
+class ThumbnailCache:
+    """サムネイルを非同期に取得し、メモリとディスクのLRUキャッシュで保持する
+
+    画像は取得時に一度だけデコード・縮小され、以降は縮小済みの画像のみを扱う。
+    取得はデーモンスレッドのワーカー数を制限したプールで行い、完了時には
+    `on_loaded(url, ok)` がワーカースレッドから呼ばれる。失敗時の `ok` はFalse。
+    """
+
+    def __init__(
+        self,
+        on_loaded,
+        cache_dir=THUMBNAIL_CACHE_PATH,
+        memory_limit=THUMBNAIL_MEMORY_LIMIT,
+        disk_limit=THUMBNAIL_DISK_LIMIT,
+        max_workers=THUMBNAIL_FETCH_WORKERS,
+    ):
+        self.on_loaded = on_loaded
+        self.cache_dir = Path(cache_dir)
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # url -> PIL.Image
+        self._memory_bytes = 0
+        self._disk = None  # 初回アクセス時にスキャンする: ファイル名 -> サイズ
+        self._disk_bytes = 0
+        self._pending = set()
+        self._wanted = None
+        # 終了時に通信のタイムアウトを待たないよう、ThreadPoolExecutorではなく
+        # デーモンスレッドで取得する
+        self._requests = queue.Queue()
+        for i in range(max_workers):
+            threading.Thread(
+                target=self._worker, name=f"thumbnail_{i}", daemon=True
+            ).start()
+
+    def get(self, url):
+        """メモリキャッシュ上の画像を返す。無ければNone"""
+        with self._lock:
+            image = self._memory.get(url)
+            if image is not None:
+                self._memory.move_to_end(url)
+            return image
+
+    def request(self, url):
+        """サムネイルを要求する。キャッシュ済みなら画像を、未取得ならNoneを返す
+
+        最後に要求されたURL以外の取得待ちは、ワーカーが処理を始める時点で破棄される。
+        """
+        image = self.get(url)
+        if image is not None:
+            return image
+        with self._lock:
+            self._wanted = url
+            if url in self._pending:
+                return None
+            self._pending.add(url)
+        self._requests.put(url)
+        return None
+
+    def shutdown(self):
+        with self._lock:
+            self._wanted = None  # 取得待ちはすべて破棄される
+
+    def _worker(self):
+        while True:
+            self._fetch(self._requests.get())
+
+    def _fetch(self, url):
+        try:
+            with self._lock:
+                if url != self._wanted:
+                    return  # 選択が既に別の項目へ移っている
+            image = self._load_from_disk(url)
+            if image is None:
+                with urllib.request.urlopen(url, timeout=10) as response:
+                    data = response.read()
+                image = self._decode(data)
+                self._save_to_disk(url, image)
+            self._store(url, image)
+            self.on_loaded(url, True)
+        except Exception as e:
+            print(f"サムネイルの取得に失敗: {e}")
+            self.on_loaded(url, False)
+        finally:
+            with self._lock:
+                self._pending.discard(url)
+
+    @staticmethod
+    def _decode(data):
+        image = Image.open(io.BytesIO(data))
+        # JPEGは縮小しながらデコードできるので、フルサイズの展開を避ける
+        image.draft("RGB", THUMBNAIL_SIZE)
+        image = image.convert("RGB")
+        image.thumbnail(THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+        return image
+
+    def _store(self, url, image):
+        width, height = image.size
+        with self._lock:
+            if url in self._memory:
+                return
+            self._memory[url] = image
+            self._memory_bytes += width * height * 3
+            while self._memory_bytes > self.memory_limit and len(self._memory) > 1:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted.size[0] * evicted.size[1] * 3
+
+    def _disk_name(self, url):
+        return hashlib.sha1(url.encode("utf-8")).hexdigest() + ".jpg"
+
+    def _scan_disk(self):
+        """ディスクキャッシュを更新日時の古い順に読み込む。ロックを保持して呼ぶこと"""
+        if self._disk is not None:
+            return
+        self._disk = OrderedDict()
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        entries = sorted(
+            (e for e in os.scandir(self.cache_dir) if e.name.endswith(".jpg")),
+            key=lambda e: e.stat().st_mtime,
+        )
+        for entry in entries:
+            size = entry.stat().st_size
+            self._disk[entry.name] = size
+            self._disk_bytes += size
+
+    def _load_from_disk(self, url):
+        name = self._disk_name(url)
+        with self._lock:
+            self._scan_disk()
+            if name not in self._disk:
+                return None
+            self._disk.move_to_end(name)
+        path = self.cache_dir / name
+        try:
+            os.utime(path)
+            with Image.open(path) as image:
+                image.load()
+                return image.copy()
+        except OSError:
+            with self._lock:
+                self._disk_bytes -= self._disk.pop(name, 0)
+            return None
+
+    def _save_to_disk(self, url, image):
+        name = self._disk_name(url)
+        path = self.cache_dir / name
+        tmp_path = path.with_suffix(".tmp")
+        try:
+            image.save(tmp_path, "JPEG", quality=85)
+            os.replace(tmp_path, path)
+            size = path.stat().st_size
+        except OSError as e:
+            print(f"サムネイルのキャッシュ保存に失敗: {e}")
+            return
+        with self._lock:
+            self._scan_disk()
+            self._disk_bytes += size - self._disk.pop(name, 0)
+            self._disk[name] = size
+            while self._disk_bytes > self.disk_limit and len(self._disk) > 1:
+                evicted, evicted_size = self._disk.popitem(last=False)
+                self._disk_bytes -= evicted_size
+                try:
+                    (self.cache_dir / evicted).unlink()
+                except OSError:
+                    pass
+
+
+def expected_filesize(info):
+    """info辞書から完成ファイルのおおよそのサイズを求める。不明ならNone"""
+    formats = info.get("requested_formats") or [info]
+    sizes = [f.get("filesize") for f in formats]
+    if not all(sizes):
+        return None
+    return sum(sizes)
+
+
+class VerificationCancelled(Exception):
+    """アプリの終了などで検証が中断された"""
+
+
+def file_checksum(path, chunk_size=VERIFY_CHUNK_SIZE, stop_event=None):
+    """ファイルを一定サイズずつ読み込みながらSHA-256を計算する
+
+    `stop_event` がセットされると VerificationCancelled を送出する。
+    """
+    digest = hashlib.sha256()
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        while size := f.readinto(buffer):
+            if stop_event is not None and stop_event.is_set():
+                raise VerificationCancelled()
+            digest.update(view[:size])
+    return digest.hexdigest()
+
+
+def _lower_thread_priority():
+    """検証スレッドがダウンロードとI/Oを奪い合わないよう、スレッドの優先度を下げる"""
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            THREAD_MODE_BACKGROUND_BEGIN = 0x00010000
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetThreadPriority(
+                kernel32.GetCurrentThread(), THREAD_MODE_BACKGROUND_BEGIN
+            )
+        elif hasattr(os, "setpriority"):
+            # Linuxではnice値がスレッド単位で設定される。I/Oの優先度に反映されるのは
+            # CFQ/BFQスケジューラの場合のみ
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+    except Exception as e:
+        print(f"検証スレッドの優先度変更に失敗: {e}")
+
+
+def _lower_process_io_priority(process):
+    """起動した子プロセスのI/O優先度を「非常に低い」に下げる (Windowsのみ)
+
+    IDLE_PRIORITY_CLASSはCPUの優先度しか下げず、バックグラウンドモードは
+    自プロセスにしか設定できないため、NtSetInformationProcessで直接設定する。
+    """
+    if sys.platform != "win32":
+        return
+    try:
+        import ctypes
+        PROCESS_IO_PRIORITY = 33
+        IO_PRIORITY_VERY_LOW = ctypes.c_ulong(0)
+        status = ctypes.windll.ntdll.NtSetInformationProcess(
+            int(process._handle),
+            PROCESS_IO_PRIORITY,
+            ctypes.byref(IO_PRIORITY_VERY_LOW),
+            ctypes.sizeof(IO_PRIORITY_VERY_LOW),
+        )
+        if status != 0:
+            print(f"ffmpegのI/O優先度変更に失敗: NTSTATUS {status & 0xFFFFFFFF:#010x}")
+    except Exception as e:
+        print(f"ffmpegのI/O優先度変更に失敗: {e}")
+
+
+class FinishedFileCollector(yt_dlp.postprocessor.PostProcessor):
+    """すべての後処理が終わったファイルの情報を検証用に記録する"""
+
+    def __init__(self, finished, check_size=True):
+        super().__init__()
+        self.finished = finished
+        self.check_size = check_size
+
+    def run(self, info):
+        self.finished.append({
+            "filepath": info.get("filepath"),
+            "duration": info.get("duration"),
+            # 音声の変換後はサイズが元の形式と一致しないので比較しない
+            "filesize": expected_filesize(info) if self.check_size else None,
+        })
+        return [], info
+
+
+class DownloadVerifier:
+    """完了したファイルをバックグラウンドで検証し、チェックサムをマニフェストに記録する
+
+    検証はサイズ・長さの確認、ffmpegによるコンテナの読み通し、SHA-256の計算の順に行い、
+    結果は `on_result(token, error, filepath)` でワーカースレッドから通知される。
+    成功時の `error` はNone、失敗時の `filepath` は検証に失敗したファイル (不明ならNone)。
+    ファイルの削除や再ダウンロードは呼び出し側が判断する。
+    `shutdown` 後は実行中の検証も中断され、結果の通知は行われない。
+    """
+
+    def __init__(self, on_result, ffmpeg_path=FFMPEG_PATH, max_workers=VERIFY_WORKERS):
+        self.on_result = on_result
+        self.ffmpeg_path = Path(ffmpeg_path)
+        self._manifest_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._process_lock = threading.Lock()
+        self._processes = set()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="verify",
+            initializer=_lower_thread_priority,
+        )
+
+    def submit(self, token, files):
+        self._executor.submit(self._verify_all, token, files)
+
+    def shutdown(self):
+        self._stop_event.set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._process_lock:
+            for process in self._processes:
+                process.kill()
+
+    def _verify_all(self, token, files):
+        try:
+            for file in files:
+                error = self._verify(file)
+                if self._stop_event.is_set():
+                    return
+                if error:
+                    self.on_result(token, error, file["filepath"])
+                    return
+            self.on_result(token, None, None)
+        except VerificationCancelled:
+            pass
+        except Exception as e:
+            if not self._stop_event.is_set():
+                self.on_result(token, f"検証中にエラーが発生しました: {e}", None)
+
+    def _verify(self, file):
+        if not file["filepath"]:
+            return "保存されたファイルのパスが不明です"
+        path = Path(file["filepath"])
+        if not path.is_file():
+            return f"ファイルが見つかりません: {path.name}"
+
+        size = path.stat().st_size
+        expected_size = file["filesize"]
+        if size == 0 or (expected_size and size < expected_size * VERIFY_SIZE_TOLERANCE):
+            return f"ファイルサイズが不足しています ({size} / {expected_size} バイト)"
+
+        error = self._probe(path, file["duration"])
+        if error:
+            return error
+
+        checksum = file_checksum(path, stop_event=self._stop_event)
+        self._write_manifest(path, checksum)
+        return None
+
+    def _probe(self, path, expected_duration):
+        """ffmpegでストリームをデコードせずに読み通し、破損と実際の長さを確認する"""
+        if not self.ffmpeg_path.exists():
+            print(f"警告: ffmpegが見つからないため検証を省略します: {self.ffmpeg_path}")
+            return None
+        command = [
+            str(self.ffmpeg_path), "-hide_banner", "-nostdin", "-nostats",
+            "-v", "error", "-xerror", "-progress", "pipe:1",
+            "-i", str(path), "-map", "0", "-c", "copy", "-f", "null", "-",
+        ]
+        creationflags = 0
+        if sys.platform == "win32":
+            creationflags = subprocess.CREATE_NO_WINDOW | subprocess.IDLE_PRIORITY_CLASS
+        with self._process_lock:
+            if self._stop_event.is_set():
+                raise VerificationCancelled()
+            process = subprocess.Popen(
+                command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                text=True, errors="replace", creationflags=creationflags,
+            )
+            self._processes.add(process)
+        try:
+            _lower_process_io_priority(process)
+            stdout, stderr = process.communicate()
+        finally:
+            with self._process_lock:
+                self._processes.discard(process)
+        if self._stop_event.is_set():
+            raise VerificationCancelled()
+        if process.returncode != 0:
+            details = stderr.strip().splitlines()[-1:] or ["不明なエラー"]
+            return f"ファイルが破損しています: {details[0]}"
+        times = re.findall(r"^out_time_us=(\d+)$", stdout, re.MULTILINE)
+        # ffmpegのバージョンによって長さが読めない場合は、ffmpegが無い場合と同様に確認を省略する
+        if expected_duration and times:
+            actual_duration = int(times[-1]) / 1_000_000
+            if actual_duration < expected_duration - max(2, expected_duration * 0.02):
+                return (
+                    f"再生時間が不足しています "
+                    f"({format_duration(actual_duration)} / {format_duration(expected_duration)})"
+                )
+        return None
+
+    def _write_manifest(self, path, checksum):
+        """フォルダごとのマニフェストを sha256sum 互換の形式で更新する"""
+        manifest = path.parent / VERIFY_MANIFEST_NAME
+        with self._manifest_lock:
+            entries = OrderedDict()
+            if manifest.exists():
+                for line in manifest.read_text(encoding="utf-8").splitlines():
+                    digest, sep, name = line.partition(" *")
+                    if sep:
+                        entries[name] = digest
+            entries[path.name] = checksum
+            tmp_path = manifest.with_suffix(".tmp")
+            tmp_path.write_text(
+                "".join(f"{digest} *{name}\n" for name, digest in entries.items()),
+                encoding="utf-8",
+            )
+            os.replace(tmp_path, manifest)
+
+
 # --- メインアプリケーションクラス ---
 class App(tk.Tk):
     def __init__(self):
@@ -91,18 +746,42 @@ class App(tk.Tk):
         self.download_thread = None
         self.current_download_item_id = None
         self.comm_queue = queue.Queue()
+        self.settings = SettingsStore(self)
+        self.preview_photo = None
+        self.preview_url = None
+        self._preview_after_id = None
+        self.thumbnail_cache = ThumbnailCache(
+            on_loaded=lambda url, ok: self.comm_queue.put(
+                ("thumbnail_loaded", (url, ok))
+            )
+        )
+        self.retry_items = []
+        self.retry_lock = threading.Lock()
+        self.verifier = DownloadVerifier(
+            on_result=lambda token, error, filepath: self.comm_queue.put(
+                ("verification_result", (token, error, filepath))
+            )
+        )
 
         # --- UIの作成 ---
         self._create_widgets()
 
         # --- テーマの適用 ---
-        self.current_theme = self.load_setting("theme", "dark")
+        self.current_theme = self.settings.get("theme", "dark")
         self.set_theme(self.current_theme)
 
         # --- 定期的なキューのチェック ---
         self.after(100, self.process_comm_queue)
         self.check_for_updates()
 
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+
+    def on_close(self):
+        self.thumbnail_cache.shutdown()
+        self.verifier.shutdown()
+        self.settings.flush()
+        self.destroy()
+
     def check_for_updates(self):
         thread = threading.Thread(target=self._update_check_thread, daemon=True)
         thread.start()
@@ -234,9 +913,31 @@ class App(tk.Tk):
             main_paned_window, text="ダウンロードキュー", padding=10
         )
         main_paned_window.add(queue_frame, weight=2)
+        # プレビューとボタンを先に下から配置し、狭いウィンドウでは一覧の方を縮める
+        preview_frame = ttk.LabelFrame(queue_frame, text="プレビュー", padding=10)
+        preview_frame.pack(side=tk.BOTTOM, fill=tk.X, pady=(10, 0))
+        thumbnail_frame = ttk.Frame(
+            preview_frame, width=THUMBNAIL_SIZE[0], height=THUMBNAIL_SIZE[1]
+        )
+        thumbnail_frame.pack_propagate(False)
+        thumbnail_frame.pack(side=tk.LEFT)
+        self.preview_image_label = ttk.Label(
+            thumbnail_frame, text="項目を選択してください", anchor=tk.CENTER
+        )
+        self.preview_image_label.pack(fill=tk.BOTH, expand=True)
+        self.preview_info_label = ttk.Label(
+            preview_frame, text="", justify=tk.LEFT, anchor=tk.NW, wraplength=320
+        )
+        self.preview_info_label.pack(
+            side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(10, 0)
+        )
+        queue_button_frame = ttk.Frame(queue_frame)
+        queue_button_frame.pack(side=tk.BOTTOM, fill=tk.X, pady=(5, 0))
+        tree_frame = ttk.Frame(queue_frame)
+        tree_frame.pack(fill=tk.BOTH, expand=True)
         cols = ("#", "タイトル", "ステータス")
         self.queue_tree = ttk.Treeview(
-            queue_frame, columns=cols, show="headings", selectmode="browse"
+            tree_frame, columns=cols, show="headings", selectmode="browse"
         )
         self.queue_tree.column("#", width=40, anchor=tk.CENTER)
         self.queue_tree.column("タイトル", width=350)
@@ -244,17 +945,16 @@ class App(tk.Tk):
         for col in cols:
             self.queue_tree.heading(col, text=col)
         vsb = ttk.Scrollbar(
-            queue_frame, orient="vertical", command=self.queue_tree.yview
+            tree_frame, orient="vertical", command=self.queue_tree.yview
         )
         hsb = ttk.Scrollbar(
-            queue_frame, orient="horizontal", command=self.queue_tree.xview
+            tree_frame, orient="horizontal", command=self.queue_tree.xview
         )
         self.queue_tree.configure(yscrollcommand=vsb.set, xscrollcommand=hsb.set)
         vsb.pack(side=tk.RIGHT, fill=tk.Y)
         hsb.pack(side=tk.BOTTOM, fill=tk.X)
         self.queue_tree.pack(fill=tk.BOTH, expand=True)
-        queue_button_frame = ttk.Frame(queue_frame)
-        queue_button_frame.pack(fill=tk.X, pady=(5, 0))
+        self.queue_tree.bind("<<TreeviewSelect>>", self._on_queue_select)
         self.remove_button = ttk.Button(
             queue_button_frame,
             text="キューを削除",
@@ -274,7 +974,7 @@ class App(tk.Tk):
         path_frame = ttk.Frame(options_frame)
         path_frame.pack(fill=tk.X, pady=5)
         ttk.Label(path_frame, text="保存先:").pack(side=tk.LEFT)
-        self.path_var = tk.StringVar(value=Path.home() / "Downloads")
+        self.path_var = tk.StringVar(value=self.settings.get_option("save_path"))
         path_entry = ttk.Entry(path_frame, textvariable=self.path_var)
         path_entry.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
         self.browse_button = ttk.Button(
@@ -289,7 +989,9 @@ class App(tk.Tk):
         ttk.Label(options_frame, text="保存ファイル名:").pack(
             fill=tk.X, pady=(10, 2)
         )
-        self.filename_template_var = tk.StringVar(value="%(title)s [%(id)s]")
+        self.filename_template_var = tk.StringVar(
+            value=self.settings.get_option("filename_template")
+        )
         filename_template_entry = ttk.Entry(
             options_frame, textvariable=self.filename_template_var
         )
@@ -301,37 +1003,55 @@ class App(tk.Tk):
         ).pack(anchor="w")
 
         ttk.Label(options_frame, text="保存形式:").pack(fill=tk.X, pady=(10, 2))
-        self.format_var = tk.StringVar(value="mp4")
+        self.format_var = tk.StringVar(value=self.settings.get_option("format"))
         self.format_combo = ttk.Combobox(
             options_frame,
             textvariable=self.format_var,
             state="readonly",
-            values=[
-                "最良動画", "mp4", "mp4+aac", "webm", "mkv",
-                "最良音声", "mp3", "m4a", "wav", "flac",  # "opus"
-            ],
+            values=FORMAT_CHOICES,
         )
         self.format_combo.pack(fill=tk.X)
         ttk.Label(options_frame, text="画質:").pack(fill=tk.X, pady=(10, 2))
-        self.quality_var = tk.StringVar(value="1080p")
+        self.quality_var = tk.StringVar(value=self.settings.get_option("quality"))
         self.quality_combo = ttk.Combobox(
             options_frame,
             textvariable=self.quality_var,
             state="readonly",
-            values=[
-                "最高画質",
-                "4320p (8K)",
-                "2160p (4K)",
-                "1440p (2K)",
-                "1080p",
-                "720p",
-                "480p",
-                "360p",
-                "最小ファイルサイズ",
-            ],
+            values=QUALITY_CHOICES,
         )
         self.quality_combo.pack(fill=tk.X)
 
+        self.option_vars = {
+            "save_path": self.path_var,
+            "filename_template": self.filename_template_var,
+            "format": self.format_var,
+            "quality": self.quality_var,
+        }
+        for key, var in self.option_vars.items():
+            var.trace_add(
+                "write",
+                lambda *_, key=key, var=var: self.settings.set_option(key, var.get()),
+            )
+        # 保存形式・画質が変わったら、選択中の項目の形式を判定し直す
+        for var in (self.format_var, self.quality_var):
+            var.trace_add("write", lambda *_: self._on_queue_select())
+
+        ttk.Label(options_frame, text="プリセット:").pack(fill=tk.X, pady=(10, 2))
+        preset_frame = ttk.Frame(options_frame)
+        preset_frame.pack(fill=tk.X)
+        self.preset_var = tk.StringVar()
+        self.preset_combo = ttk.Combobox(
+            preset_frame, textvariable=self.preset_var, values=self.settings.presets()
+        )
+        self.preset_combo.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.preset_combo.bind("<<ComboboxSelected>>", self.apply_preset)
+        ttk.Button(preset_frame, text="保存", command=self.save_preset).pack(
+            side=tk.LEFT, padx=(5, 0)
+        )
+        ttk.Button(preset_frame, text="削除", command=self.delete_preset).pack(
+            side=tk.LEFT, padx=(5, 0)
+        )
+
         bottom_frame = ttk.Frame(self, padding=10)
         bottom_frame.pack(fill=tk.X)
         self.status_label = ttk.Label(bottom_frame, text="準備完了")
@@ -349,10 +1069,100 @@ class App(tk.Tk):
         )
         self.download_button.pack(side=tk.LEFT)
 
+    def _on_queue_select(self, event=None):
+        # 高速なスクロールやキー連打で取得が溜まらないよう、選択が落ち着いてから更新する
+        if self._preview_after_id is not None:
+            self.after_cancel(self._preview_after_id)
+        self._preview_after_id = self.after(PREVIEW_DEBOUNCE_MS, self.update_preview)
+
+    def update_preview(self):
+        self._preview_after_id = None
+        selected = self.queue_tree.selection()
+        if not selected:
+            self._clear_preview()
+            return
+        item = self.download_queue[self.queue_tree.index(selected[0])]
+        self._show_preview_details(item)
+
+        self.preview_url = select_thumbnail_url(item["info"])
+        if not self.preview_url:
+            self.preview_photo = None
+            self.preview_image_label.config(image="", text="サムネイルなし")
+            return
+        image = self.thumbnail_cache.request(self.preview_url)
+        if image is None:
+            self.preview_photo = None
+            self.preview_image_label.config(image="", text="読み込み中...")
+        else:
+            self._show_thumbnail(image)
+
+    def _show_preview_details(self, item):
+        info = item["info"]
+        details = [
+            f"長さ: {info.get('duration_string') or format_duration(info.get('duration'))}",
+            f"投稿者: {info.get('uploader') or info.get('channel') or '不明'}",
+            f"形式: {self._describe_format(item)}",
+        ]
+        self.preview_info_label.config(text="\n".join(details))
+
+    def _show_thumbnail(self, image):
+        self.preview_photo = ImageTk.PhotoImage(image)
+        self.preview_image_label.config(image=self.preview_photo, text="")
+
+    def _clear_preview(self):
+        self.preview_url = None
+        self.preview_photo = None
+        self.preview_image_label.config(image="", text="項目を選択してください")
+        self.preview_info_label.config(text="")
+
+    def _describe_format(self, item):
+        """現在のオプションでダウンロードされる形式を返す
+
+        形式の一覧を持つ項目はyt-dlpで実際に選ばれる形式を別スレッドで判定し、
+        オプションごとに項目へキャッシュする。再生リストの平坦な項目は形式の一覧が無いため、
+        オプションの内容をそのまま返す。
+        """
+        options = self.settings.options()
+        if not item["info"].get("formats"):
+            if options["format"] in AUDIO_FORMAT_MAP:
+                return f"{options['format']} (ダウンロード時に決定)"
+            return f"{options['format']} / {options['quality']} (ダウンロード時に決定)"
+        key = (options["format"], options["quality"])
+        resolved = item.setdefault("resolved_formats", {})
+        if key not in resolved:
+            resolved[key] = None  # 判定中
+            thread = threading.Thread(
+                target=self._resolve_format_thread, args=(item, key, options)
+            )
+            thread.daemon = True
+            thread.start()
+        return resolved[key] or "判定中..."
+
+    def _resolve_format_thread(self, item, key, options):
+        """ダウンロード時と同じオプションで、ダウンロードせずに形式を選択する"""
+        try:
+            ydl_opts, _ = self._build_ydl_opts(options)
+            ydl_opts.update({
+                "quiet": True,
+                "no_warnings": True,
+                "progress_hooks": [],
+                "postprocessors": [],
+            })
+            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+                resolved = ydl.process_ie_result(
+                    copy.deepcopy(item["info"]), download=False
+                )
+            ext = ydl_opts.get("final_ext") or resolved.get("ext")
+            text = f"{resolved.get('format') or '不明'} ({ext})"
+        except Exception as e:
+            print(f"形式の判定に失敗: {e}")
+            text = "判定できません"
+        self.comm_queue.put(("format_resolved", (item, key, text)))
+
     def set_theme(self, theme):
         sv_ttk.set_theme(theme)
         self.current_theme = theme
-        self.save_setting("theme", theme)
+        self.settings.set("theme", theme)
         self.apply_fonts()
         self._load_icons()
         self._update_button_icons()
@@ -379,6 +1189,37 @@ class App(tk.Tk):
         self.style.configure("Treeview.Heading", font=self.default_font_bold)
         self.style.configure("TLabelframe.Label", font=self.default_font)
 
+    def apply_preset(self, event=None):
+        name = self.preset_var.get()
+        options = self.settings.get_preset(name)
+        if options is None:
+            return
+        for key, var in self.option_vars.items():
+            if key in options:
+                var.set(options[key])
+        self.update_status(f"プリセット「{name}」を適用しました")
+
+    def save_preset(self):
+        name = self.preset_var.get().strip()
+        if not name:
+            self.update_status("プリセット名を入力してください", error=True)
+            return
+        self.settings.save_preset(
+            name, {key: var.get() for key, var in self.option_vars.items()}
+        )
+        self.preset_combo.config(values=self.settings.presets())
+        self.update_status(f"プリセット「{name}」を保存しました")
+
+    def delete_preset(self):
+        name = self.preset_var.get().strip()
+        if self.settings.get_preset(name) is None:
+            self.update_status("削除するプリセットを選択してください", error=True)
+            return
+        self.settings.delete_preset(name)
+        self.preset_combo.config(values=self.settings.presets())
+        self.preset_var.set("")
+        self.update_status(f"プリセット「{name}」を削除しました")
+
     def paste_from_clipboard(self):
         try:
             self.url_entry.delete(0, tk.END)
@@ -453,14 +1294,16 @@ class App(tk.Tk):
             return
         item_id = selected[0]
         index = self.queue_tree.index(item_id)
-        if (
-            self.is_downloading
-            and self.queue_tree.item(item_id, "values")[2] == "ダウンロード中"
+        if self.is_downloading and (
+            item_id == self.current_download_item_id
+            or self.queue_tree.item(item_id, "values")[2] == "ダウンロード中"
         ):
             self.update_status("ダウンロード中の項目は削除できません", error=True)
             return
         del self.download_queue[index]
+        self._drop_retries({item_id})
         self.queue_tree.delete(item_id)
+        self._clear_preview()
         self.update_status("選択項目を削除しました")
 
     def clear_queue(self):
@@ -468,70 +1311,104 @@ class App(tk.Tk):
             self.update_status("ダウンロード中はキューをクリアできません", error=True)
             return
         self.download_queue.clear()
+        self._drop_retries(set(self.queue_tree.get_children()))
         for i in self.queue_tree.get_children():
             self.queue_tree.delete(i)
+        self._clear_preview()
         self.update_status("キューをクリアしました")
 
-    def start_download(self):
+    def start_download(self, retry_only=False):
         if self.is_downloading:
             self.update_status("既にダウンロード処理が実行中です", error=True)
             return
-        if not self.download_queue:
+        if not self.download_queue and not retry_only:
             self.update_status("キューが空です", error=True)
             return
         self.is_downloading = True
         self.download_button.config(text="ダウンロード中...", state="disabled")
         self.progress_bar["value"] = 0
-        self.download_thread = threading.Thread(target=self._download_worker)
+        self.download_thread = threading.Thread(
+            target=self._download_worker, args=(retry_only,)
+        )
         self.download_thread.daemon = True
         self.download_thread.start()
 
-    def _download_worker(self):
-        for index, item in enumerate(self.download_queue):
-            item_id = self.queue_tree.get_children()[index]
-            self.current_download_item_id = item_id
-            self.comm_queue.put(
-                (
-                    "update_status_text",
-                    f"{index + 1}/{len(self.download_queue)}: {item['title']}",
+    def _download_worker(self, retry_only=False):
+        if not retry_only:
+            for index, item in enumerate(self.download_queue):
+                item_id = self.queue_tree.get_children()[index]
+                self._download_item(
+                    item_id, item, f"{index + 1}/{len(self.download_queue)}"
                 )
-            )
-            self.comm_queue.put(("update_item_status", (item_id, "ダウンロード中")))
-            try:
-                ret = self._process_single_download(item)  # TODO: YDLのwith文をfor文の外に出す最適化
-                self.comm_queue.put(("update_item_status", (item_id, "不完全" if ret else "完了")))  # str(ret or "完了")
-            except Exception as e:
-                self.comm_queue.put(("update_item_status", (item_id, "エラー")))
-                clean_message = re.sub(r"\x1b\[[0-9;]*m", "", str(e))
-                error_details = {
-                    "title": "ダウンロードエラー",
-                    "message": f"「{item['title']}」のダウンロード中にエラーが発生しました。\n\n詳細: {clean_message}",
-                }
-                self.comm_queue.put(("error", error_details))
-                # raise e
+        # 検証に失敗して再キューされた項目
+        while True:
+            with self.retry_lock:
+                if not self.retry_items:
+                    break
+                # 削除された項目は _drop_retries でメインスレッドから取り除かれている
+                item_id, item = self.retry_items.pop(0)
+            self._download_item(item_id, item, "再試行")
         self.comm_queue.put(("download_finished", None))
 
+    def _drop_retries(self, item_ids):
+        """キューから削除される項目を再試行待ちからも取り除く"""
+        with self.retry_lock:
+            self.retry_items = [
+                (item_id, item)
+                for item_id, item in self.retry_items
+                if item_id not in item_ids
+            ]
+
+    def _download_item(self, item_id, item, label):
+        self.current_download_item_id = item_id
+        self.comm_queue.put(("update_status_text", f"{label}: {item['title']}"))
+        self.comm_queue.put(("update_item_status", (item_id, "ダウンロード中")))
+        try:
+            ret, finished = self._process_single_download(item)  # TODO: YDLのwith文をfor文の外に出す最適化
+            if ret:
+                self.comm_queue.put(("update_item_status", (item_id, "不完全")))
+            elif finished:
+                self.comm_queue.put(("update_item_status", (item_id, "検証中")))
+                self.verifier.submit((item_id, item), finished)
+            else:
+                self.comm_queue.put(("update_item_status", (item_id, "完了")))
+        except Exception as e:
+            self.comm_queue.put(("update_item_status", (item_id, "エラー")))
+            clean_message = re.sub(r"\x1b\[[0-9;]*m", "", str(e))
+            error_details = {
+                "title": "ダウンロードエラー",
+                "message": f"「{item['title']}」のダウンロード中にエラーが発生しました。\n\n詳細: {clean_message}",
+            }
+            self.comm_queue.put(("error", error_details))
+            # raise e
+
     def _process_single_download(self, item):
-        save_path = Path(self.path_var.get())
-        save_path.mkdir(parents=True, exist_ok=True)
-        quality_map = {
-            "最高画質": None,
-            "4320p (8K)": "res:4320",
-            "2160p (4K)": "res:2160",
-            "1440p (2K)": "res:1440",
-            "1080p": "res:1080",
-            "720p": "res:720",
-            "480p": "res:480",
-            "360p": "res:360",
-            "ファイルサイズ最小": "+size",
-        }
+        # ワーカースレッドからTkの変数を読まず、メモリ上の設定を参照する
+        options = self.settings.options()
+        Path(options["save_path"]).mkdir(parents=True, exist_ok=True)
+        ydl_opts, check_size = self._build_ydl_opts(options)
+        finished = []
+        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+            ydl.add_post_processor(
+                FinishedFileCollector(finished, check_size=check_size),
+                when="after_move",
+            )
+            ydl.process_ie_result(item["info"])
+            return ydl._download_retcode, finished
+
+    def _build_ydl_opts(self, options):
+        """オプションからyt-dlpの設定を組み立てる
+
+        音声の変換を行わない (ファイルサイズを検証できる) かどうかも合わせて返す。
+        """
+        save_path = Path(options["save_path"])
 
-        filename_template = self.filename_template_var.get()
+        filename_template = options["filename_template"]
         if not filename_template.strip():
             filename_template = "%(title)s [%(id)s]"
 
         output_template = save_path / f"{filename_template}.%(ext)s"
-        format_type = self.format_var.get().partition(" ")[0]
+        format_type = options["format"].partition(" ")[0]
         ext = None if format_type.startswith("最良") else format_type.partition("-")[0]
 
         ydl_opts = {
@@ -545,19 +1422,11 @@ class App(tk.Tk):
             # "max_sleep_interval": 20,
             # "sleep_interval_subtitles": 5,
             "concurrent_fragment_downloads": cpu_count() or 1,
-            "ffmpeg_location": str(RESOURCE_PATH / "ffmpeg" / "ffmpeg.exe"),
+            "ffmpeg_location": str(FFMPEG_PATH),
             "extractor_args": {"youtube": {"formats": ["dashy"]}},
         }
 
-        audio_format_map = {
-            "最良音声": "ba/b",
-            "mp3": "ba[acodec^=mp3]/ba/b",
-            "m4a": "ba[acodec^=aac]/ba[acodec^=mp4a.40.]/ba/b",
-            "opus": "ba/b",
-            "wav": "ba/b",
-            "flac": "ba/b",
-        }
-        if fmt := audio_format_map.get(format_type):
+        if fmt := AUDIO_FORMAT_MAP.get(format_type):
             ydl_opts["format"] = fmt
             ydl_opts["postprocessors"] = [{
                 "key": "FFmpegExtractAudio",
@@ -566,7 +1435,7 @@ class App(tk.Tk):
                 "nopostoverwrites": False,
             }]
         else:
-            sort_list = [q] if (q := quality_map.get(self.quality_var.get())) else []
+            sort_list = [q] if (q := QUALITY_MAP.get(options["quality"])) else []
             if ext:  # format_type != "最良動画"
                 if format_type == "mp4-h.264+aac":
                     sort_list += [
@@ -577,9 +1446,7 @@ class App(tk.Tk):
                 ]
                 ydl_opts["merge_output_format"] = ext
             ydl_opts["format_sort"] = sort_list
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.process_ie_result(item["info"])
-            return ydl._download_retcode
+        return ydl_opts, fmt is None
 
     def progress_hook(self, d):
         if d["status"] == "downloading":
@@ -609,6 +1476,8 @@ class App(tk.Tk):
                     self.status_label.config(text=data)
                 elif message_type == "update_item_status":
                     item_id, status = data
+                    if not self.queue_tree.exists(item_id):
+                        continue
                     current_values = list(self.queue_tree.item(item_id, "values"))
                     current_values[2] = status
                     self.queue_tree.item(item_id, values=tuple(current_values))
@@ -617,45 +1486,90 @@ class App(tk.Tk):
                 elif message_type == "download_finished":
                     self.is_downloading = False
                     self.download_button.config(text="ダウンロード開始", state="normal")
-                    self.update_status("すべてのダウンロードが完了しました。")
+                    if self._count_verifying():
+                        self.update_status("ダウンロードが完了しました。ファイルを検証中です...")
+                    else:
+                        self.update_status("すべてのダウンロードが完了しました。")
                     self.progress_bar["value"] = 0
+                    with self.retry_lock:
+                        has_retries = bool(self.retry_items)
+                    if has_retries:
+                        self.start_download(retry_only=True)
+                elif message_type == "verification_result":
+                    self._handle_verification_result(*data)
                 elif message_type == "error":
                     messagebox.showerror(data["title"], data["message"])
                     self.update_status(f"エラー: {data['title']}", error=True)
                 elif message_type == 'update_available':
                     self._show_update_prompt(data)
+                elif message_type == "format_resolved":
+                    item, key, text = data
+                    item["resolved_formats"][key] = text
+                    selected = self.queue_tree.selection()
+                    if (
+                        selected
+                        and self.download_queue[self.queue_tree.index(selected[0])] is item
+                    ):
+                        self._show_preview_details(item)
+                elif message_type == "thumbnail_loaded":
+                    url, ok = data
+                    if url == self.preview_url:
+                        image = self.thumbnail_cache.get(url) if ok else None
+                        if image is not None:
+                            self._show_thumbnail(image)
+                        else:
+                            self.preview_photo = None
+                            self.preview_image_label.config(image="", text="サムネイルなし")
         except queue.Empty:
             pass
         finally:
             self.after(100, self.process_comm_queue)
 
+    def _handle_verification_result(self, token, error, filepath):
+        item_id, item = token
+        if not self.queue_tree.exists(item_id):
+            return  # 検証中にキューから削除された
+        current_values = list(self.queue_tree.item(item_id, "values"))
+        if error is None:
+            current_values[2] = "完了"
+        else:
+            item["verify_retries"] = item.get("verify_retries", 0) + 1
+            if item["verify_retries"] > VERIFY_MAX_RETRIES:
+                # 検証の誤判定もありうるので、最後の失敗ではファイルを残しておく
+                current_values[2] = "検証エラー"
+                kept = f" ファイルは残しています: {Path(filepath).name}" if filepath else ""
+                self.update_status(
+                    f"検証に失敗しました: {item['title']} ({error}){kept}", error=True
+                )
+            else:
+                # 再ダウンロード時に既存のファイルとして扱われないよう削除する
+                if filepath:
+                    try:
+                        Path(filepath).unlink()
+                    except OSError:
+                        pass
+                current_values[2] = "再試行待ち"
+                self.update_status(f"検証に失敗したため再試行します: {item['title']} ({error})")
+                with self.retry_lock:
+                    self.retry_items.append((item_id, item))
+                if not self.is_downloading:
+                    self.start_download(retry_only=True)
+        self.queue_tree.item(item_id, values=tuple(current_values))
+        if error is None and not self.is_downloading and not self._count_verifying():
+            self.update_status("すべてのダウンロードと検証が完了しました。")
+
+    def _count_verifying(self):
+        return sum(
+            1
+            for item_id in self.queue_tree.get_children()
+            if self.queue_tree.item(item_id, "values")[2] == "検証中"
+        )
+
     def update_status(self, message, error=False):
         self.status_label.config(text=message)
         if error:
             print(f"ERROR: {message}")
 
-    def save_setting(self, key, value):
-        settings = {}
-        if SETTINGS_PATH.exists():
-            with open(SETTINGS_PATH, "r") as f:
-                try:
-                    settings = json.load(f)
-                except json.JSONDecodeError:
-                    pass
-        settings[key] = value
-        with open(SETTINGS_PATH, "w") as f:
-            json.dump(settings, f, indent=4)
-
-    def load_setting(self, key, default=None):
-        if not SETTINGS_PATH.exists():
-            return default
-        with open(SETTINGS_PATH, "r") as f:
-            try:
-                settings = json.load(f)
-                return settings.get(key, default)
-            except json.JSONDecodeError:
-                return default
-
     def open_settings(self):
         SettingsWindow(self)
 